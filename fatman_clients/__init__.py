@@ -1,6 +1,9 @@
 
 
+import re
+
 from os import path
+from functools import lru_cache
 
 try:
     from collections.abc import Iterator
@@ -12,10 +15,17 @@ CA_BUNDLE_SEARCH_PATHS = [
     "/etc/ssl/certs/ca-certificates.crt",  # Gentoo
     ]
 
+# default (connect, read) timeout for all requests issued via get_session(),
+# to avoid blocking indefinitely on an unresponsive server
+REQUEST_TIMEOUT = (3.05, 30)
+
 
+@lru_cache(maxsize=1)
 def try_verify_by_system_ca_bundle():
     """Try to locate a system CA bundle and use that if available,
-       otherwise, return True to use the bundled (provided by certifi) CA package"""
+       otherwise, return True to use the bundled (provided by certifi) CA package
+
+       The result is cached since the bundle location does not change at runtime."""
 
     for ca_path in CA_BUNDLE_SEARCH_PATHS:
         if path.exists(ca_path):
@@ -25,81 +35,126 @@ def try_verify_by_system_ca_bundle():
     return None
 
 
-def xyz_parser_iterator(string, include_match_object=False, unmatched_cb=None):
-    """
-    Yields a tuple `(natoms, comment, atomiter)`for each frame
-    in a XYZ file where `atomiter` is an iterator yielding a
-    nested tuple `(symbol, (x, y, z))` for each entry.
+@lru_cache(maxsize=None)
+def get_session(url, ssl_verify=True, timeouts=True):
+    """Get a requests Session for the given server URL with a pooled HTTPAdapter mounted,
+       re-using an already created Session for the same argument combination.
 
-    :param string: a string containing XYZ-structured text
-    :param include_match_object: append the original regex match object to the returned tuple
-    :param unmatched_cb: Callback for umatched (not-whitespace) content, gets the unmatched string
-    """
+       With timeouts enabled (the fclient default), requests without an explicit timeout
+       get REQUEST_TIMEOUT applied and POSTs are retried on transient upstream errors.
+       The daemon disables this: its calls must neither abort on a slow server after a
+       finished computation nor replay an artifact upload a proxy already passed through."""
 
-    class BlockIterator(Iterator):
-        """
-        An iterator for wrapping the iterator returned by `match.finditer`
-        to extract the required fields directly from the match object
-        """
+    import requests
+    from requests.packages import urllib3
+
+    class TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
+        """HTTPAdapter applying REQUEST_TIMEOUT to requests without an explicit timeout"""
+        def send(self, request, **kwargs):
+            if kwargs.get('timeout') is None:
+                kwargs['timeout'] = REQUEST_TIMEOUT
+            return super(TimeoutHTTPAdapter, self).send(request, **kwargs)
+
+    sess = requests.Session()
+
+    # identify ourselves instead of hiding behind the generic python-requests UA
+    sess.headers['User-Agent'] = 'fatman-clients ({})'.format(requests.utils.default_user_agent())
+
+    # advertise the best response compression urllib3 can actually decode here:
+    # Brotli/zstd shave considerably more off large JSON listings than gzip,
+    # but are only decoded transparently if the respective package is installed
+    decoders = urllib3.response.HTTPResponse.CONTENT_DECODERS
+    sess.headers['Accept-Encoding'] = ', '.join(
+        [enc for enc in ('zstd', 'br') if enc in decoders] + ['gzip', 'deflate'])
+
+    if ssl_verify:
+        sess.verify = try_verify_by_system_ca_bundle()
+    else:
+        sess.verify = False
+        urllib3.disable_warnings()
 
-        def __init__(self, it, natoms, include_match_object=False):
-            self._it = it
-            self._natoms = natoms
-            self._catom = 0
-            self._include_match_object = include_match_object
-
-        def __iter__(self):
-            return self
-
-        def __next__(self):
-            try:
-                match = self._it.next()
-            except StopIteration:
-                # if we reached the number of atoms declared, everything is well
-                # and we re-raise the StopIteration exception
-                if self._catom == self._natoms:
-                    raise
-                else:
-                    # otherwise we got too less entries
-                    raise TypeError("Number of atom entries ({}) is smaller "
-                                    "than the number of atoms ({})".format(
-                                        self._catom, self._natoms))
-
-            self._catom += 1
-
-            if self._catom > self._natoms:
-                raise TypeError("Number of atom entries ({}) is larger "
+    # retry transient upstream errors with a short backoff instead of failing outright;
+    # POSTs are only safe to replay for the CLI, whose creation endpoints reject duplicates
+    retry_methods = ['GET', 'DELETE', 'POST'] if timeouts else ['GET', 'DELETE']
+    retry = urllib3.util.Retry(total=3, backoff_factor=0.3,
+                               status_forcelist=(502, 503, 504),
+                               allowed_methods=frozenset(retry_methods))
+
+    # pool both plain and TLS connections to keep them alive across sequential
+    # requests, sized to cover the concurrent up-/downloads of the bulk commands
+    adapter_cls = TimeoutHTTPAdapter if timeouts else requests.adapters.HTTPAdapter
+    adapter = adapter_cls(pool_connections=32, pool_maxsize=64, max_retries=retry)
+    sess.mount('https://', adapter)
+    sess.mount('http://', adapter)
+
+    return sess
+
+
+class BlockIterator(Iterator):
+    """
+    An iterator for wrapping the iterator returned by `match.finditer`
+    to extract the required fields directly from the match object
+    """
+
+    def __init__(self, it, natoms, include_match_object=False):
+        self._it = it
+        self._natoms = natoms
+        self._catom = 0
+        self._include_match_object = include_match_object
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            match = next(self._it)
+        except StopIteration:
+            # if we reached the number of atoms declared, everything is well
+            # and we re-raise the StopIteration exception
+            if self._catom == self._natoms:
+                raise
+            else:
+                # otherwise we got too less entries
+                raise TypeError("Number of atom entries ({}) is smaller "
                                 "than the number of atoms ({})".format(
                                     self._catom, self._natoms))
 
-            if self._include_match_object:
-                return (
-                    match.group('sym'),
-                    (
-                        float(match.group('x')),
-                        float(match.group('y')),
-                        float(match.group('z'))
-                    ),
-                    match)
-            else:
-                return (
-                    match.group('sym'),
-                    (
-                        float(match.group('x')),
-                        float(match.group('y')),
-                        float(match.group('z'))
-                    ))
+        self._catom += 1
+
+        if self._catom > self._natoms:
+            raise TypeError("Number of atom entries ({}) is larger "
+                            "than the number of atoms ({})".format(
+                                self._catom, self._natoms))
 
-        def next(self):
-            """
-            The iterator method expected by python 2.x,
-            implemented as python 3.x style method.
-            """
-            return self.__next__()
+        if self._include_match_object:
+            return (
+                match.group('sym'),
+                (
+                    float(match.group('x')),
+                    float(match.group('y')),
+                    float(match.group('z'))
+                ),
+                match)
+        else:
+            return (
+                match.group('sym'),
+                (
+                    float(match.group('x')),
+                    float(match.group('y')),
+                    float(match.group('z'))
+                ))
+
+    def next(self):
+        """
+        The iterator method expected by python 2.x,
+        implemented as python 3.x style method.
+        """
+        return self.__next__()
 
-    import re
 
-    pos_regex = re.compile(r"""
+# compiled once at import time since xyz_parser_iterator may be called
+# repeatedly (and compiling the block regex in particular is not cheap)
+POS_REGEX = re.compile(r"""
 ^                                                                             # Linestart
 [ \t]*                                                                        # Optional white space
 (?P<sym>[A-Za-z]+[A-Za-z0-9]*)\s+                                             # get the symbol
@@ -107,7 +162,7 @@ def xyz_parser_iterator(string, include_match_object=False, unmatched_cb=None):
 (?P<y> [\+\-]?  ( \d*[\.]\d+  | \d+[\.]?\d* )  ([Ee][\+\-]?\d+)? ) [ \t]+     # Get y
 (?P<z> [\+\-]?  ( \d*[\.]\d+  | \d+[\.]?\d* )  ([Ee][\+\-]?\d+)? )            # Get z
 """, re.X | re.M)
-    pos_block_regex = re.compile(r"""
+POS_BLOCK_REGEX = re.compile(r"""
                                                             # First line contains an integer
                                                             # and only an integer: the number of atoms
 ^[ \t]* (?P<natoms> [0-9]+) [ \t]*[\n]                      # End first line
@@ -148,8 +203,20 @@ def xyz_parser_iterator(string, include_match_object=False, unmatched_cb=None):
 )                                                           # A positions block should be one or more lines
                     """, re.X | re.M)
 
+
+def xyz_parser_iterator(string, include_match_object=False, unmatched_cb=None):
+    """
+    Yields a tuple `(natoms, comment, atomiter)`for each frame
+    in a XYZ file where `atomiter` is an iterator yielding a
+    nested tuple `(symbol, (x, y, z))` for each entry.
+
+    :param string: a string containing XYZ-structured text
+    :param include_match_object: append the original regex match object to the returned tuple
+    :param unmatched_cb: Callback for umatched (not-whitespace) content, gets the unmatched string
+    """
+
     last_end = 0
-    for block in pos_block_regex.finditer(string):
+    for block in POS_BLOCK_REGEX.finditer(string):
         natoms = int(block.group('natoms'))
 
         if unmatched_cb:
@@ -163,7 +230,7 @@ def xyz_parser_iterator(string, include_match_object=False, unmatched_cb=None):
                 natoms,
                 block.group('comment'),
                 BlockIterator(
-                    pos_regex.finditer(block.group('positions')),
+                    POS_REGEX.finditer(block.group('positions')),
                     natoms,
                     True),
                 block
@@ -173,6 +240,6 @@ def xyz_parser_iterator(string, include_match_object=False, unmatched_cb=None):
                 natoms,
                 block.group('comment'),
                 BlockIterator(
-                    pos_regex.finditer(block.group('positions')),
+                    POS_REGEX.finditer(block.group('positions')),
                     natoms)
             )
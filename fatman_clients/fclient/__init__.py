@@ -2,29 +2,100 @@
 
 from uuid import UUID
 
-import requests
-from requests.packages import urllib3
 import click
 
 from .. import (
-    try_verify_by_system_ca_bundle,
+    get_session,
     xyz_parser_iterator,
     )
 
+#: headers to send along with a body pre-serialized by json_bytes()
+JSON_BODY_HEADERS = {'Content-Type': 'application/json'}
+
+try:
+    import orjson
+
+    def response_json(resp):
+        """Decode a requests Response body via orjson (faster than the stdlib decoder)"""
+        return orjson.loads(resp.content)
+
+    def json_bytes(payload):
+        """Serialize a request body to JSON bytes via orjson in a single pass"""
+        return orjson.dumps(payload)
+except ImportError:
+    def response_json(resp):
+        """Decode a requests Response body via the stdlib json module"""
+        return resp.json()
+
+    def json_bytes(payload):
+        """Serialize a request body to JSON bytes via the stdlib json module"""
+        import json
+        return json.dumps(payload).encode('utf-8')
+
+
 def json_pretty_dumps(orig):
-    import json
-    return json.dumps(orig, sort_keys=True,
-                      indent=4, separators=(',', ': '))
+    try:
+        import orjson
+        return orjson.dumps(orig, option=orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2).decode('utf-8')
+    except ImportError:
+        import json
+        return json.dumps(orig, sort_keys=True,
+                          indent=4, separators=(',', ': '))
+
+
+class PlainTable:
+    """Minimal ASCII table renderer with the same interface and output
+       as the terminaltables.AsciiTable subset used here, but computing
+       the column widths in a single pass over the data"""
+
+    def __init__(self, table_data):
+        self.table_data = table_data
+        self.inner_heading_row_border = True
+
+    @property
+    def table(self):
+        # split cells into lines once, recording the column widths along the way
+        rows = []
+        widths = []
+
+        for row in self.table_data:
+            cells = [str(cell).splitlines() or [''] for cell in row]
+
+            for idx, lines in enumerate(cells):
+                width = max(len(l) for l in lines)
+                if idx >= len(widths):
+                    widths.append(width)
+                elif width > widths[idx]:
+                    widths[idx] = width
+
+            rows.append(cells)
+
+        separator = '+' + '+'.join('-' * (width + 2) for width in widths) + '+'
+
+        output = [separator]
+        for ridx, cells in enumerate(rows):
+            for lineno in range(max(len(lines) for lines in cells)):
+                line = (lines[lineno] if lineno < len(lines) else '' for lines in cells)
+                output.append('| ' + ' | '.join(c.ljust(w) for c, w in zip(line, widths)) + ' |')
+            # no heading border for a header-only table, where AsciiTable
+            # prints just the closing border instead of doubling it
+            if ridx == 0 and len(rows) > 1 and self.inner_heading_row_border:
+                output.append(separator)
+        output.append(separator)
+
+        return '\n'.join(output)
 
 
 def get_table_instance(table_data, has_header=True):
     from sys import stdout
-    from terminaltables import SingleTable, AsciiTable
 
     if stdout.isatty():
+        # keep the box-drawing style for interactive use
+        from terminaltables import SingleTable
         tinstance = SingleTable(table_data)
     else:
-        tinstance = AsciiTable(table_data)
+        # large (piped) listings go through the single-pass renderer
+        tinstance = PlainTable(table_data)
 
     tinstance.inner_heading_row_border = has_header
     return tinstance
@@ -48,12 +119,7 @@ def cli(ctx, url, ssl_verify):
 
     ctx.obj['url'] = url
 
-    ctx.obj['session'] = requests.Session()
-    if ssl_verify:
-        ctx.obj['session'].verify = try_verify_by_system_ca_bundle()
-    else:
-        ctx.obj['session'].verify = False
-        urllib3.disable_warnings()
+    ctx.obj['session'] = get_session(url, ssl_verify)
 
 
 from . import basis, calc, deltatest, struct, task, testresult
@@ -74,7 +140,7 @@ def command(ctx, code, machine):
 
     req = ctx.obj['session'].get(ctx.obj['command_url'])
     req.raise_for_status()
-    cmd_content = req.json()
+    cmd_content = response_json(req)
 
     click.echo("Commands:")
     for cmd in cmd_content['commands']:
@@ -104,7 +170,7 @@ def cmd_set_cmd(ctx, name, cmd):
 
     req = ctx.obj['session'].get(ctx.obj['command_url'])
     req.raise_for_status()
-    cmd_content = req.json()
+    cmd_content = response_json(req)
 
     for ccmd in cmd_content['commands']:
         if ccmd['name'] == name:
@@ -1,12 +1,15 @@
 
 import re
 from uuid import UUID
-from io import BytesIO
 
 import click
-import requests
 
-from . import cli, json_pretty_dumps, get_table_instance
+from . import cli, json_pretty_dumps, get_table_instance, response_json
+
+
+# empty and comment lines should not end up in the uploaded basis
+EMPTY_LINE = re.compile(rb'^[ \t\r]*(?:#[^\n]*)?\n', re.M)
+BLOCK_DEFINITION = re.compile(rb'^[ \t]*(?P<element>[a-zA-Z]{1,2})[ \t]+(?P<family>\S+).*$', re.M)
 
 
 @cli.group()
@@ -17,7 +20,7 @@ def basis(ctx):
 
 
 @basis.command('add')
-@click.argument('basisset_file', type=click.File(mode='r'))
+@click.argument('basisset_file', type=click.File(mode='rb'))
 @click.option('family_filter', '--filter', type=str,
               required=False, default='.*', show_default=True,
               help="Python regex to filter by name")
@@ -27,76 +30,73 @@ def basis(ctx):
 @click.pass_context
 def basis_add(ctx, basisset_file, family_filter, dump_basis):
     """Upload new basis sets from a file"""
-    basissets = {}
-    current_basis = None
-
-    EMPTY_LINE = re.compile(r'^(\s*|\s*#.*)$')
-    BLOCK_DEFINITION = re.compile(r'^\s*(?P<element>[a-zA-Z]{1,2})\s+(?P<family>\S+).*\n')
-    FAMILY_FILTER = re.compile(family_filter)
 
-    ignore_lines = False
+    import requests
+    from requests_toolbelt import MultipartEncoder
 
-    for line in basisset_file:
-        if EMPTY_LINE.match(line):
-            # ignore empty and comment lines
-            continue
+    basissets = {}
 
-        match = BLOCK_DEFINITION.match(line)
+    FAMILY_FILTER = re.compile(family_filter)
 
-        if match:
-            if current_basis and dump_basis:
-                click.echo(basissets[current_basis].getvalue().decode('utf-8'))
+    content = basisset_file.read()
 
-            if not FAMILY_FILTER.match(match.group('family')):
-                click.echo(("Ignoring basis set for element '{element}'"
-                            " and family '{family}' (filter does not match)").format(**match.groupdict()))
-                ignore_lines = True
-                continue
-            else:
-                ignore_lines = False
+    # locate all block headers in a single pass and slice the content
+    # in-between instead of looping and buffering line-by-line
+    headers = list(BLOCK_DEFINITION.finditer(content))
 
-            click.echo(("Found basis set for element '{element}'"
-                        " and family '{family}'").format(**match.groupdict()))
-            current_basis = (match.group('element'), match.group('family'))
+    leading = content[:headers[0].start()] if headers else content
+    if EMPTY_LINE.sub(b'', leading).strip():
+        raise ValueError("invalid basis set file")
 
-            if current_basis in basissets.keys():
-                ValueError(("duplicated basis set for element '{element}'"
-                            " and family '{family}' found").format(**match.groupdict()))
+    for match, next_match in zip(headers, headers[1:] + [None]):
+        element = match.group('element').decode('utf-8')
+        family = match.group('family').decode('utf-8')
 
-            basissets[current_basis] = BytesIO()
-            # we don't want this line to end up in our uploaded file
+        if not FAMILY_FILTER.match(family):
+            click.echo(("Ignoring basis set for element '{}'"
+                        " and family '{}' (filter does not match)").format(element, family))
             continue
 
-        if ignore_lines:
-            continue
+        click.echo(("Found basis set for element '{}'"
+                    " and family '{}'").format(element, family))
+        current_basis = (element, family)
+
+        if current_basis in basissets:
+            raise ValueError(("duplicated basis set for element '{}'"
+                              " and family '{}' found").format(element, family))
 
-        if not current_basis:
-            raise ValueError("invalid basis set file")
+        # the basis itself starts after the header line and ends at the next header (or EOF)
+        start = match.end() + 1
+        end = next_match.start() if next_match is not None else len(content)
+        basissets[current_basis] = EMPTY_LINE.sub(b'', content[start:end])
 
-        basissets[current_basis].write(line.encode('utf-8'))
+        if dump_basis:
+            click.echo(basissets[current_basis].decode('utf-8'))
 
     click.confirm("Do you want to upload the basis sets (total: {})?".format(len(basissets)), abort=True)
 
     for (element, family), basis_data in basissets.items():
         click.echo("Uploading basis set for '{}' and family '{}'.. ".format(element, family), nl=False)
 
-        # rewind to the beginning
-        basis_data.seek(0)
+        # stream the multipart body instead of having requests buffer a full copy
+        enc = MultipartEncoder(fields={
+            'element': element,
+            'family': family,
+            'basis': ('basis', basis_data, 'application/octet-stream')})
 
         req = ctx.obj['session'].post(
             ctx.obj['basis_url'],
-            data={'element': element, 'family': family},
-            files={'basis': basis_data})
+            data=enc, headers={'Content-Type': enc.content_type})
 
         try:
             req.raise_for_status()
         except requests.exceptions.HTTPError as exc:
             click.echo("failed")
             try:
-                msgs = exc.response.json()
+                msgs = response_json(exc.response)
 
                 # try to extract the error message
-                if isinstance(msgs, dict) and 'errors' in msgs.keys():
+                if isinstance(msgs, dict) and 'errors' in msgs:
                     ctx.fail(json_pretty_dumps(msgs['errors']))
 
                 ctx.fail(json_pretty_dumps(msgs))
@@ -124,7 +124,7 @@ def basis_list(ctx, **filters):
     req = ctx.obj['session'].get(ctx.obj['basis_url'], params=params)
     req.raise_for_status()
 
-    basis_sets = req.json()
+    basis_sets = response_json(req)
 
     table_data = [['id', 'element', 'family', ], ]
     for basis_set in basis_sets:
@@ -154,7 +154,7 @@ def basis_download(ctx, basis_set_ids, **filters):
     req = ctx.obj['session'].get(ctx.obj['basis_url'], params=params)
     req.raise_for_status()
 
-    basis_sets = req.json()
+    basis_sets = response_json(req)
 
     filename = "BASIS_{family}-{element}"
 
@@ -163,7 +163,7 @@ def basis_download(ctx, basis_set_ids, **filters):
 
         req = ctx.obj['session'].get(basis_set['_links']['self'])
         req.raise_for_status()
-        basis_set = req.json()
+        basis_set = response_json(req)
 
         with open(filename.format(**basis_set), 'w') as fhandle:
             fhandle.write("{element} {family}\n".format(**basis_set))
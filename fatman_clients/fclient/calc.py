@@ -5,14 +5,11 @@ import csv
 import textwrap
 
 from uuid import UUID
+from functools import lru_cache
 
 import click
-import requests
-from requests.utils import parse_header_links
-import six
-import dpath
 
-from . import cli, json_pretty_dumps, get_table_instance
+from . import cli, json_pretty_dumps, get_table_instance, json_bytes, JSON_BODY_HEADERS, response_json
 
 
 # the maximal number of calculations to fetch details for
@@ -21,6 +18,15 @@ MAX_CALC_DETAILS = 600
 MAX_CALC_PER_PAGE = 200
 
 
+@lru_cache(maxsize=128)
+def resolve_structureset_calculations(session, structureset_url):
+    """Resolve the calculations link of a structure set,
+       caching the result since the link is stable within one invocation"""
+    req = session.get(structureset_url)
+    req.raise_for_status()
+    return response_json(req)['_links']['calculations']
+
+
 def validate_basis_set_families(ctx, param, values):
     """Convert and validate basis set families arguments"""
     try:
@@ -107,11 +113,14 @@ def calc_add(ctx, structure_set, create_task, deferred_task, settings_file, **da
 
     """
 
+    import requests
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
     if structure_set and data['structure']:
-        raise click.BadOptionUsage("structure and structure-set can not be specified together")
+        raise click.BadOptionUsage('--structure-set', "structure and structure-set can not be specified together")
 
     if settings_file and data['settings']:
-        raise click.BadOptionUsage("settings and settings-file can not be specified together")
+        raise click.BadOptionUsage('--settings-file', "settings and settings-file can not be specified together")
 
     if data['settings']:
         # if settings are specified, load the JSON from the string
@@ -130,7 +139,7 @@ def calc_add(ctx, structure_set, create_task, deferred_task, settings_file, **da
 
     req = ctx.obj['session'].get(ctx.obj['calc_coll_url'])
     req.raise_for_status()
-    calc_colls = req.json()
+    calc_colls = response_json(req)
 
     if data['collection'] not in [c['name'] for c in calc_colls]:
         click.confirm("The specified collection '{collection}' does not exist. Do you want to create it?".format(**data),
@@ -144,16 +153,24 @@ def calc_add(ctx, structure_set, create_task, deferred_task, settings_file, **da
     if structure_set:
         click.echo("Creating calculations.. ", nl=False)
 
-        req = ctx.obj['session'].get(ctx.obj['structureset_url'] + '/' + structure_set)
-        req.raise_for_status()
+        structureset_url = ctx.obj['structureset_url'] + '/' + structure_set
+
+        # serialize the payload once, outside the error-handling block
+        body = json_bytes({k: v for k, v in data.items() if k != 'structure'})
 
         try:
-            url = req.json()['_links']['calculations']
+            # the calculations URL is derivable, try the direct POST first and
+            # only discover the link if the server does not know the route
+            req = ctx.obj['session'].post(structureset_url + '/calculations',
+                                          data=body, headers=JSON_BODY_HEADERS)
+
+            if req.status_code in (404, 405):
+                url = resolve_structureset_calculations(ctx.obj['session'], structureset_url)
+                req = ctx.obj['session'].post(url, data=body, headers=JSON_BODY_HEADERS)
 
-            req = ctx.obj['session'].post(url, json={k: v for k, v in data.items() if k != 'structure'})
             req.raise_for_status()
 
-            calculations = req.json()
+            calculations = response_json(req)
 
             click.echo("succeeded")
 
@@ -161,11 +178,29 @@ def calc_add(ctx, structure_set, create_task, deferred_task, settings_file, **da
                 click.echo(".. created calculation '{id}' for structure '{structure[name]}'".format(**calculation))
 
             if create_task:
-                for calculation in calculations:
-                    click.echo(".. creating task for calculation '{id}'.. ".format(**calculation), nl=False)
-                    req = ctx.obj['session'].post(calculation['_links']['tasks'], json=task_creation_data)
+                # try to create all tasks in a single round trip first
+                req = ctx.obj['session'].post(
+                    '{}/{}/tasks'.format(ctx.obj['structureset_url'], structure_set),
+                    data=json_bytes(dict(task_creation_data,
+                                         calculation_ids=[c['id'] for c in calculations])),
+                    headers=JSON_BODY_HEADERS)
+
+                if req.status_code in (404, 405):
+                    # no bulk endpoint on this server,
+                    # task creation is one round trip per calculation, run them concurrently
+                    with ThreadPoolExecutor(max_workers=16) as executor:
+                        futures = {executor.submit(ctx.obj['session'].post,
+                                                   calculation['_links']['tasks'],
+                                                   json=task_creation_data): calculation
+                                   for calculation in calculations}
+
+                        for future in as_completed(futures):
+                            calculation = futures[future]
+                            future.result().raise_for_status()
+                            click.echo(".. created task for calculation '{id}'".format(**calculation))
+                else:
                     req.raise_for_status()
-                    click.echo("succeeded")
+                    click.echo(".. created tasks for {} calculations".format(len(calculations)))
             else:
                 click.echo("skipping task creation..")
 
@@ -173,10 +208,10 @@ def calc_add(ctx, structure_set, create_task, deferred_task, settings_file, **da
             click.echo("failed")
 
             try:
-                msgs = exc.response.json()
+                msgs = response_json(exc.response)
                 errors = msgs['errors']
-                attr, msg = six.next(six.iteritems(errors))
-                if attr in list(data.keys()) + ['structure_set']:
+                attr, msg = next(iter(errors.items()))
+                if attr in data or attr == 'structure_set':
                     raise click.BadParameter(
                         '; '.join([str(m) for m in msg]) if isinstance(msg, list) else str(msg),
                         param_hint=attr)
@@ -190,37 +225,115 @@ def calc_add(ctx, structure_set, create_task, deferred_task, settings_file, **da
     else:
         click.echo("Creating calculation..")
 
+        params = {}
+        if create_task:
+            # ask the server to create the task in the same request,
+            # saving one full round trip (ignored by older servers)
+            params = {'with_task': 1, 'task_status': task_creation_data['status']}
+
         try:
-            req = ctx.obj['session'].post(ctx.obj['calc_url'], json=data)
+            req = ctx.obj['session'].post(ctx.obj['calc_url'], data=json_bytes(data),
+                                          headers=JSON_BODY_HEADERS, params=params)
             req.raise_for_status()
-            click.echo(json_pretty_dumps(req.json()))
+            calculation = response_json(req)
+            click.echo(json_pretty_dumps(calculation))
 
         except requests.exceptions.HTTPError as exc:
             try:
-                msgs = exc.response.json()
-                attr, msg = list(msgs['errors'].items())[0]
+                msgs = response_json(exc.response)
+                attr, msg = next(iter(msgs['errors'].items()))
                 raise click.BadParameter(str(msg[0] if isinstance(msg, list) else msg), param_hint=attr)
             except (ValueError, KeyError):
                 click.echo(exc.response.text, err=True)
+                ctx.abort()
 
         if create_task:
-            click.echo("Creating task for calculation..")
-            req = ctx.obj['session'].post(req.json()['_links']['tasks'], json=task_creation_data)
-            req.raise_for_status()
-            click.echo(json_pretty_dumps(req.json()))
+            if 'task' in calculation:
+                # the server understood with_task and already created it
+                pass
+            else:
+                click.echo("Creating task for calculation..")
+                req = ctx.obj['session'].post(calculation['_links']['tasks'], json=task_creation_data)
+                req.raise_for_status()
+                click.echo(json_pretty_dumps(response_json(req)))
         else:
             click.echo("skipping task creation..")
 
 
+@calc.command('add-batch')
+@click.argument('calcs_file', type=click.File(mode='r'))
+@click.option('--task/--no-task', 'create_task',
+              default=True, show_default=True,
+              help="also create a task for each calculation")
+@click.option('--deferred-task/--no-deferred-task',
+              default=False, show_default=True,
+              help="whether the tasks are created as deferred")
+@click.option('--max-workers', type=int,
+              default=16, show_default=True,
+              help="maximal number of concurrent submissions")
+@click.pass_context
+def calc_add_batch(ctx, calcs_file, create_task, deferred_task, max_workers):
+    """Submit many calculations concurrently from a JSON file.
+
+    The file must contain a list of objects as accepted by the
+    calculations endpoint (same fields as for 'calc add')."""
+
+    import requests
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    payload = json.load(calcs_file)
+
+    if not isinstance(payload, list):
+        raise click.UsageError("the batch file must contain a list of calculations")
+
+    task_creation_data = {'status': 'deferred' if deferred_task else 'new'}
+
+    def submit(data):
+        req = ctx.obj['session'].post(ctx.obj['calc_url'], data=json_bytes(data),
+                                      headers=JSON_BODY_HEADERS)
+        req.raise_for_status()
+        calculation = response_json(req)
+
+        if create_task:
+            treq = ctx.obj['session'].post(calculation['_links']['tasks'], json=task_creation_data)
+            treq.raise_for_status()
+
+        return calculation
+
+    nfailed = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(submit, entry): entry for entry in payload}
+
+        for future in as_completed(futures):
+            entry = futures[future]
+
+            try:
+                calculation = future.result()
+            except requests.exceptions.HTTPError as exc:
+                nfailed += 1
+                click.echo("failed to create calculation for structure '{}': {}".format(
+                    entry.get('structure'), exc.response.text), err=True)
+                continue
+
+            click.echo(".. created calculation '{id}' for structure '{structure}'".format(
+                id=calculation['id'], structure=entry.get('structure')))
+
+    if nfailed:
+        ctx.exit(1)
+
+
 @calc.command('del')
 @click.argument('calc_id', type=UUID, nargs=-1, required=True)
 @click.pass_context
 def calc_delete(ctx, calc_id):
     """Delete the specified calculations"""
 
+    base = ctx.obj['calc_url'] + '/'
+
     for cid in calc_id:
         try:
-            req = ctx.obj['session'].delete(ctx.obj['calc_url'] + '/{}'.format(cid))
+            req = ctx.obj['session'].delete(base + str(cid))
             req.raise_for_status()
         except:
             click.echo("deleting calculation '{}' failed".format(cid), err=True)
@@ -255,6 +368,9 @@ def calc_list(ctx, show_ids, columns, csv_output, with_details, sorted_by, fetch
     List calculations. Use the parameters to limit the list to certain subsets of calculations
     """
 
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from requests.utils import parse_header_links
+
     # filter out filters not specified
     params = {k: v for k, v in filters.items() if v is not None}
 
@@ -263,7 +379,7 @@ def calc_list(ctx, show_ids, columns, csv_output, with_details, sorted_by, fetch
 
     req = ctx.obj['session'].get(ctx.obj['calc_url'], params=params)
     req.raise_for_status()
-    calcs = req.json()
+    calcs = response_json(req)
 
     total_count = int(req.headers['X-total-count'])
     if total_count > len(calcs):
@@ -276,7 +392,7 @@ def calc_list(ctx, show_ids, columns, csv_output, with_details, sorted_by, fetch
 
                 req = ctx.obj['session'].get(next_link, params=params)
                 req.raise_for_status()
-                calcs += req.json()
+                calcs += response_json(req)
         else:
             click.echo("WARNING: Result list truncated to {} elements of total {}".format(MAX_CALC_PER_PAGE, total_count), err=True)
 
@@ -286,11 +402,20 @@ def calc_list(ctx, show_ids, columns, csv_output, with_details, sorted_by, fetch
 
         click.echo('Please wait, fetching details..', err=True)
 
-        with click.progressbar(calcs, file=sys.stderr) as bar:
-            for cal in bar:
-                req = ctx.obj['session'].get(cal['_links']['self'])
-                req.raise_for_status()
-                cal.update(req.json())
+        def fetch_details(cal):
+            req = ctx.obj['session'].get(cal['_links']['self'])
+            req.raise_for_status()
+            cal.update(response_json(req))
+
+        # the detail fetches are independent round trips, run them concurrently
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            futures = [executor.submit(fetch_details, cal) for cal in calcs]
+
+            # repaint the bar ~50 times in total instead of once per completion
+            with click.progressbar(as_completed(futures), length=len(futures), file=sys.stderr,
+                                   update_min_steps=max(1, len(futures) // 50)) as bar:
+                for future in bar:
+                    future.result()
 
     header = []
     table_data = []
@@ -302,18 +427,21 @@ def calc_list(ctx, show_ids, columns, csv_output, with_details, sorted_by, fetch
             header += ['calc_id', 'current_task_id']
 
         for cal in calcs:
+            # look the current task up only once per row
+            current_task = cal.get('current_task') or {}
+
             entry = [
                 cal['test'],
                 cal['structure'] if isinstance(cal['structure'], str) else cal['structure']['name'],
                 cal['code'],
                 cal['collection'],
-                cal.get('current_task', {}).get('mtime', "(unavail)"),
-                cal.get('current_task', {}).get('status', "(unavail)"),
+                current_task.get('mtime', "(unavail)"),
+                current_task.get('status', "(unavail)"),
                 cal['results_available'],
                 ]
 
             if show_ids:
-                entry += [cal['id'], cal.get('current_task', {}).get('id', "(unavail)")]
+                entry += [cal['id'], current_task.get('id', "(unavail)")]
 
             table_data.append(entry)
     else:
@@ -321,21 +449,44 @@ def calc_list(ctx, show_ids, columns, csv_output, with_details, sorted_by, fetch
         # a default if the key was not found can be specified after a ':'
         header, paths = zip(*[p.split('=', 1) if '=' in p else (p.split('/')[-1], p) for p in columns])
 
-        def extract_data(data, path):
+        def make_getter(path):
+            """Parse a column path once and return a function resolving it in a calculation"""
             if ':' in path:
                 path, default = path.split(':')
             else:
                 default = None
 
-            try:
-                return dpath.util.get(data, path)
-            except KeyError:
-                if default:
-                    return default
-                else:
-                    raise
+            parts = [part for part in path.split('/') if part]
+
+            if any(c in part for part in parts for c in '*?['):
+                # globbing paths still go through dpath, imported on demand
+                # to keep it off the startup path of every other subcommand
+                import dpath.util
+
+                def getter(data):
+                    try:
+                        return dpath.util.get(data, path)
+                    except KeyError:
+                        if default:
+                            return default
+                        raise
+            else:
+                # .. while plain paths are resolved with direct lookups,
+                # skipping dpath's per-call path parsing and glob matching
+                def getter(data):
+                    try:
+                        for part in parts:
+                            data = data[int(part)] if isinstance(data, list) else data[part]
+                        return data
+                    except (KeyError, IndexError):
+                        if default:
+                            return default
+                        raise
+
+            return getter
 
-        table_data += [[extract_data(c, p) for p in paths] for c in calcs]
+        getters = [make_getter(p) for p in paths]
+        table_data += [[getter(c) for getter in getters] for c in calcs]
 
 
     if sorted_by:
@@ -349,7 +500,7 @@ def calc_list(ctx, show_ids, columns, csv_output, with_details, sorted_by, fetch
     if csv_output:
         writer = csv.writer(sys.stdout, lineterminator='\n')
         # when printing CSV we don't print an empty header
-        writer.writerows([header] + table_data if any(h for h in header) else table_data)
+        writer.writerows([header] + table_data if any(header) else table_data)
     else:
         table_instance = get_table_instance([header] + table_data)
         click.echo(table_instance.table)
@@ -364,16 +515,30 @@ def calc_list(ctx, show_ids, columns, csv_output, with_details, sorted_by, fetch
 def calc_generate_results(ctx, update, ids):
     """Parse results from artifacts and write them to the calculation"""
 
+    # the body is the same for every request, serialize it once
+    body = json_bytes({'generateResults': {'update': update}})
+
     if ids:
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        base = ctx.obj['calc_url'] + '/'
+
+        def trigger(cid):
+            req = ctx.obj['session'].post(base + str(cid) + '/action',
+                                          data=body, headers=JSON_BODY_HEADERS)
+            req.raise_for_status()
+
         for cid in ids:
             click.echo("Trigger result generation for calculation {}".format(cid))
-            req = ctx.obj['session'].post(ctx.obj['calc_url'] + '/{}/action'.format(cid),
-                                          json={'generateResults': {'update': update}})
-            req.raise_for_status()
+
+        # the triggers are independent round trips, run them concurrently
+        with ThreadPoolExecutor(max_workers=min(32, len(ids))) as executor:
+            for future in as_completed([executor.submit(trigger, cid) for cid in ids]):
+                future.result()
     else:
         click.echo("Trigger result generation for all calculations")
         req = ctx.obj['session'].post(ctx.obj['calc_url'] + '/action',
-                                      json={'generateResults': {'update': update}})
+                                      data=body, headers=JSON_BODY_HEADERS)
         req.raise_for_status()
 
     # TODO: implement result parsing and waiting for finish
@@ -385,14 +550,29 @@ def calc_generate_results(ctx, update, ids):
 def calc_retry(ctx, ids):
     """Re-run specified calculation(s)"""
 
-    for cid in ids:
-        req = ctx.obj['session'].get(ctx.obj['calc_url'] + '/{}'.format(cid))
-        req.raise_for_status()
-        calc_content = req.json()
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    base = ctx.obj['calc_url'] + '/'
+
+    def retry(cid):
+        # the tasks URL is derivable, try the direct POST first and only fall
+        # back to discovering the link if the server does not know the route
+        req = ctx.obj['session'].post(base + str(cid) + '/tasks', json={'status': 'new'})
+
+        if req.status_code in (404, 405):
+            req = ctx.obj['session'].get(base + str(cid))
+            req.raise_for_status()
+            calc_content = response_json(req)
+
+            req = ctx.obj['session'].post(calc_content['_links']['tasks'], json={'status': 'new'})
 
-        req = ctx.obj['session'].post(calc_content['_links']['tasks'], json={'status': 'new'})
         req.raise_for_status()
 
+    # the retries are independent round trips, run the ids concurrently
+    with ThreadPoolExecutor(max_workers=min(32, len(ids))) as executor:
+        for future in as_completed([executor.submit(retry, cid) for cid in ids]):
+            future.result()
+
 
 @calc.command('tag')
 @click.argument('tag', type=str, required=True)
@@ -410,6 +590,8 @@ def calc_tag(ctx, tag, ids, reset_tags, **filters):
     Tag calculations. Use the parameters to limit the list to certain subsets of calculations
     """
 
+    from requests.utils import parse_header_links
+
     # filter out filters not specified
     params = {k: v for k, v in filters.items() if v is not None}
 
@@ -421,7 +603,7 @@ def calc_tag(ctx, tag, ids, reset_tags, **filters):
         params['hide_tags'] = ['dummy-tag-here']  # make sure that all calculations are found
         req = ctx.obj['session'].get(ctx.obj['calc_url'], params=params)
         req.raise_for_status()
-        ids = [c['id'] for c in req.json()]
+        ids = [c['id'] for c in response_json(req)]
 
         if req.links['last']:
             while True:
@@ -432,7 +614,7 @@ def calc_tag(ctx, tag, ids, reset_tags, **filters):
 
                 req = ctx.obj['session'].get(next_link, params=params)
                 req.raise_for_status()
-                ids += [c['id'] for c in req.json()]
+                ids += [c['id'] for c in response_json(req)]
 
     if params and ids:  # if selected by params and the search returned something
         click.confirm("Are you sure you want to tag {} calculations with '{}'?".format(len(ids), tag), abort=True)
@@ -441,7 +623,7 @@ def calc_tag(ctx, tag, ids, reset_tags, **filters):
         click.echo("Setting tag '{}' for calculation {}".format(tag, cid), err=True)
         req = ctx.obj['session'].get(ctx.obj['calc_url'] + '/{}'.format(cid))
         req.raise_for_status()
-        calc = req.json()
+        calc = response_json(req)
 
         metadata = calc['metadata']
 
@@ -470,7 +652,7 @@ def ccollections_list(ctx):
 
     req = ctx.obj['session'].get(ctx.obj['ccollections_url'])
     req.raise_for_status()
-    ccolls = req.json()
+    ccolls = response_json(req)
 
     table_data = [
         ['id', 'name', 'description'],
@@ -2,10 +2,21 @@
 import sys
 import csv
 from uuid import UUID
+from functools import lru_cache
 
 import click
 
-from . import cli, get_table_instance
+from . import cli, get_table_instance, response_json
+
+
+@lru_cache(maxsize=8)
+def get_trcollections(session, trcollections_url):
+    """Fetch the full list of test result collections,
+       caching it per (session, url) since it is only used for names"""
+    req = session.get(trcollections_url)
+    req.raise_for_status()
+    return response_json(req)
+
 
 @cli.command('deltatest-comparison')
 @click.argument('collections', type=UUID, nargs=-1, required=True)
@@ -43,36 +54,44 @@ def deltatest_comparison(ctx, collections, analysis,
     from ..tools.deltatest import SYM_LIST, ATOMIC_ELEMENTS
 
     if analysis == 'delta' and len(collections) < 2:
-        raise click.BadOptionUsage("Need at least two collections (reference and comparison) to get delta values")
+        raise click.UsageError("Need at least two collections (reference and comparison) to get delta values")
 
     if analysis == 'evcurves' and not plot:
-        raise click.BadOptionUsage("The evcurve analysis consists only of plots")
+        raise click.UsageError("The evcurve analysis consists only of plots")
 
     collection_ids = [str(c) for c in collections]
 
-    selected_elements = ATOMIC_ELEMENTS.keys()
+    # keep the selection a frozenset: all downstream filters are membership tests
+    selected_elements = frozenset(ATOMIC_ELEMENTS)
 
     if elements:
         if '-' in elements:
             s_element, e_element = elements.split('-', maxsplit=1)
 
-            if (s_element not in ATOMIC_ELEMENTS or
-                    e_element not in ATOMIC_ELEMENTS or
-                    ATOMIC_ELEMENTS[s_element]['num'] >= ATOMIC_ELEMENTS[e_element]['num']):
-                raise click.BadOptionUsage("Invalid elements specified for --elements")
+            if s_element not in ATOMIC_ELEMENTS or e_element not in ATOMIC_ELEMENTS:
+                raise click.BadOptionUsage('--elements', "Invalid elements specified for --elements")
 
-            e_num_range = range(ATOMIC_ELEMENTS[s_element]['num'], ATOMIC_ELEMENTS[e_element]['num']+1)
+            # bind the range bounds once instead of re-doing the nested lookups per element
+            s_num = ATOMIC_ELEMENTS[s_element]['num']
+            e_num = ATOMIC_ELEMENTS[e_element]['num']
 
-            selected_elements = [k for k, v in ATOMIC_ELEMENTS.items() if v['num'] in e_num_range]
+            if s_num >= e_num:
+                raise click.BadOptionUsage('--elements', "Invalid elements specified for --elements")
+
+            selected_elements = frozenset(k for k, v in ATOMIC_ELEMENTS.items() if s_num <= v['num'] <= e_num)
 
         else:
             # split the string by its commas, strip them of whitespaces
-            selected_elements = [s.strip() for s in elements.split(',')]
-            if any(ee not in ATOMIC_ELEMENTS for ee in selected_elements):
-                raise click.BadOptionUsage("Invalid element specified for --elements")
+            selected_elements = frozenset(s.strip() for s in elements.split(','))
+            invalid = selected_elements - frozenset(ATOMIC_ELEMENTS)
+            if invalid:
+                raise click.BadOptionUsage('--elements',
+                                           "Invalid element specified for --elements: {}".format(", ".join(sorted(invalid))))
         # the single element is treated as a one-elemented list in the second case
 
     if analysis == 'delta':
+        import numpy as np
+
         comparison_url = '{url}/api/v2/comparisons'.format(**ctx.obj)
 
         reference_collection = collection_ids[0]
@@ -82,12 +101,11 @@ def deltatest_comparison(ctx, collections, analysis,
                                       json={'metric': "deltatest",
                                             'testresult_collections': collection_ids})
         req.raise_for_status()
-        cdata = req.json()
+        cdata = response_json(req)
 
         cid2cname = {c['id']: c['name'] for c in cdata['testresult_collections']}
 
-        for cid, label in labels:
-            cid2cname[str(cid)] = label
+        cid2cname.update({str(cid): label for cid, label in labels})
 
         header = ['element']
         for collection in comparison_collections:
@@ -95,12 +113,15 @@ def deltatest_comparison(ctx, collections, analysis,
 
         ncomparisons = len(comparison_collections)
 
-        deltas = [[el] + [None]*ncomparisons for el in cdata['elements']]
+        row_labels = list(cdata['elements'])
 
         # dict to convert element name to row number
-        elrows = {v: k for k, v in enumerate(cdata['elements'])}
+        elrows = {v: k for k, v in enumerate(row_labels)}
         # ... and the same for the columns
-        colcolumns = {v: k+1 for k, v in enumerate(comparison_collections)}
+        colcolumns = {v: k for k, v in enumerate(comparison_collections)}
+
+        # scatter the values into a NaN-initialized float matrix instead of a list-of-lists
+        delta_matrix = np.full((len(row_labels), ncomparisons), np.nan)
 
         for value in cdata['values']:
 
@@ -117,24 +138,25 @@ def deltatest_comparison(ctx, collections, analysis,
                 continue
 
             # fill out the matrix
-            deltas[elrows[value['element']]][colcolumns[comp_collection]] = value['delta']
+            delta_matrix[elrows[value['element']], colcolumns[comp_collection]] = value['delta']
 
-        deltas = [l for l in deltas if l[0] in selected_elements]
+        keep = [i for i, el in enumerate(row_labels) if el in selected_elements]
+        row_labels = [row_labels[i] for i in keep]
+        delta_matrix = delta_matrix[keep]
 
-        sums = [0.]*ncomparisons
-        available_deltas = [0]*ncomparisons
-        # for each comparison collection
-        for col in range(1, ncomparisons+1):
-            # build a sum over the (available) deltas
-            for entry in deltas:
-                if entry[col] is not None:
-                    sums[col-1] += entry[col]
-                    available_deltas[col-1] += 1
-        averages = [sums[i]/available_deltas[i] for i in range(len(sums))]
+        # sum and count the available deltas per comparison collection in one pass each
+        available_deltas = np.count_nonzero(~np.isnan(delta_matrix), axis=0).tolist()
+        averages = (np.nansum(delta_matrix, axis=0) / available_deltas).tolist()
 
         if hide_missing:
-            # remove lines containing Nones (= missing elements in some collection)
-            deltas = [l for l in deltas if None not in l]
+            # remove lines containing NaNs (= missing elements in some collection)
+            keep = ~np.isnan(delta_matrix).any(axis=1)
+            row_labels = [el for el, k in zip(row_labels, keep) if k]
+            delta_matrix = delta_matrix[keep]
+
+        # keep the table cells as None where no value is available, as before
+        deltas = [[el] + [None if np.isnan(v) else v for v in row]
+                  for el, row in zip(row_labels, delta_matrix)]
 
         table_data = [header] + deltas
 
@@ -164,11 +186,8 @@ def deltatest_comparison(ctx, collections, analysis,
             import matplotlib as mpl
             import matplotlib.pyplot as plt
             import matplotlib.collections as matcoll
-            import matplotlib.cm as cm
-            import numpy as np
 
-            deltas = np.array(deltas)
-            elements = deltas[:, 0]
+            elements = row_labels
             nelements = len(elements)
 
             plt.style.use('ggplot')
@@ -202,15 +221,17 @@ def deltatest_comparison(ctx, collections, analysis,
 
             for colnum in range(ncomparisons):
                 x = numbers + shifts[colnum]
-                y = deltas[:, colnum+1]
+                y = delta_matrix[:, colnum]
 
-                phandle = ax.scatter(x, y, color=colors, marker=syms[colnum], s=50)
+                # one scatter call per column is needed anyway for the distinct legend markers,
+                # but rasterize the points so vector outputs stay small and fast
+                phandle = ax.scatter(x, y, color=colors, marker=syms[colnum], s=50, rasterized=True)
                 phandles.append(phandle)
 
-                lines = []
-                for idx in range(len(x)):
-                    lines.append([(x[idx], 0), (x[idx], y[idx])]) # for each datapoint add a list of pairs (start and endpoint)
-                linecoll = matcoll.LineCollection(lines, colors=colors, linestyles=linestyles[colnum % len(linestyles)], linewidths=2)
+                # build the stem segments (baseline to datapoint) in one vectorized stack
+                lines = np.stack([np.column_stack([x, np.zeros_like(y)]),
+                                  np.column_stack([x, y])], axis=1)
+                linecoll = matcoll.LineCollection(lines, colors=colors, linestyles=linestyles[colnum % len(linestyles)], linewidths=2, rasterized=True)
                 ax.add_collection(linecoll)
 
             additional_labels = []
@@ -244,31 +265,43 @@ def deltatest_comparison(ctx, collections, analysis,
 
     elif analysis == 'condition-number':
 
+        import numpy as np
+        from concurrent.futures import ThreadPoolExecutor
+
+        from ..tools.deltatest import NUM2SYM
+
         trcollections_url = '{url}/api/v2/testresultcollections'.format(**ctx.obj)
 
-        req = ctx.obj['session'].get(trcollections_url)
-        req.raise_for_status()
-        cdata = req.json()
+        cdata = get_trcollections(ctx.obj['session'], trcollections_url)
 
         cid2cname = {c['id']: c['name'] for c in cdata if c['id'] in collection_ids}
 
-        for cid, label in labels:
-            cid2cname[str(cid)] = label
+        cid2cname.update({str(cid): label for cid, label in labels})
 
         header = ['element'] + [cid2cname[cid] for cid in collection_ids]
         ncollections = len(collection_ids)
 
         # map collection IDs to colum numbers:
-        colcolumns = {v: k+1 for k, v in enumerate(collection_ids)}
+        colcolumns = {v: k for k, v in enumerate(collection_ids)}
 
-        cond_numbers = {}
+        # scatter the values into a NaN-initialized matrix indexed by atomic
+        # number, which also keeps the rows sorted without a separate key lookup
+        max_num = max(v['num'] for v in ATOMIC_ELEMENTS.values())
+        cond_matrix = np.full((max_num, ncollections), np.nan)
 
-        for coll_id in collection_ids:
-            trcollection_url = '{url}/api/v2/testresultcollections/{trcid}'.format(trcid=coll_id, **ctx.obj)
-
-            req = ctx.obj['session'].get(trcollection_url)
+        def fetch_trcollection(coll_id):
+            req = ctx.obj['session'].get('{}/{}'.format(trcollections_url, coll_id))
             req.raise_for_status()
-            trcdata = req.json()
+            return response_json(req)
+
+        # fetch the collections concurrently, then process them in order
+        with ThreadPoolExecutor(max_workers=min(16, len(collection_ids))) as executor:
+            trcdatas = list(executor.map(fetch_trcollection, collection_ids))
+
+        nignored = 0
+
+        for coll_id, trcdata in zip(collection_ids, trcdatas):
+            col = colcolumns[coll_id]
 
             for tresult in trcdata['testresults']:
                 element = tresult.get('data', {}).get('element')
@@ -276,23 +309,29 @@ def deltatest_comparison(ctx, collections, analysis,
 
                 # ignore invalid deltatest data
                 if element is None or condnum is None:
-                    print("Ignoring:", tresult.get('data'))
+                    nignored += 1
                     continue
 
-                # create an empty list for that element in the dictionary if not already present
-                if element not in cond_numbers:
-                    cond_numbers[element] = [element] + [None]*ncollections
+                cond_matrix[ATOMIC_ELEMENTS[element]['num']-1, col] = condnum['1-norm (estimate)']['Log(CN)']
 
-                cond_numbers[element][colcolumns[coll_id]] = condnum['1-norm (estimate)']['Log(CN)']
+        if nignored:
+            click.echo("Ignored {} test results with invalid deltatest data".format(nignored), err=True)
 
-        # strip the key which we only used to avoid the manual lookup
-        cond_numbers = list(sorted(cond_numbers.values(), key=lambda l: ATOMIC_ELEMENTS[l[0]]['num']))
-
-        cond_numbers = [l for l in cond_numbers if l[0] in selected_elements]
+        # pick the rows with data for the selected elements (already in atomic-number order)
+        nums = [num for num in range(1, max_num+1)
+                if NUM2SYM[num-1] in selected_elements and not np.isnan(cond_matrix[num-1]).all()]
+        row_labels = [NUM2SYM[num-1] for num in nums]
+        cond_matrix = cond_matrix[[num-1 for num in nums]]
 
         if hide_missing:
-            # remove lines containing Nones (= missing elements in some collection)
-            cond_numbers = [l for l in cond_numbers if None not in l]
+            # remove lines containing NaNs (= missing elements in some collection)
+            keep = ~np.isnan(cond_matrix).any(axis=1)
+            row_labels = [el for el, k in zip(row_labels, keep) if k]
+            cond_matrix = cond_matrix[keep]
+
+        # keep the table cells as None where no value is available, as before
+        cond_numbers = [[el] + [None if np.isnan(v) else v for v in row]
+                        for el, row in zip(row_labels, cond_matrix)]
 
         table_data = [header] + cond_numbers
 
@@ -307,13 +346,9 @@ def deltatest_comparison(ctx, collections, analysis,
             import matplotlib as mpl
             import matplotlib.pyplot as plt
             import matplotlib.collections as matcoll
-            import matplotlib.cm as cm
-            import numpy as np
 
-            # unpack the cond_numbers list of lists manually to get
-            # a proper NumPy array of values to get reliable conversion
-            condnums = np.array([l[1:] for l in cond_numbers])
-            elements = [l[0] for l in cond_numbers]
+            condnums = cond_matrix
+            elements = row_labels
             nelements = len(elements)
 
             plt.style.use('ggplot')
@@ -349,19 +384,19 @@ def deltatest_comparison(ctx, collections, analysis,
                 x = numbers + shifts[colnum]
                 y = condnums[:, colnum]
 
-                phandle = ax.scatter(x, y, color=colors, marker=syms[colnum], zorder=10)
+                phandle = ax.scatter(x, y, color=colors, marker=syms[colnum], zorder=10, rasterized=True)
                 phandles.append(phandle)
 
-                lines = []
-                for idx in range(len(x)):
-                    lines.append([(x[idx], 0), (x[idx], y[idx])]) # for each datapoint add a list of pairs (start and endpoint)
-                linecoll = matcoll.LineCollection(lines, colors=colors, linestyles=linestyles[colnum % len(linestyles)], linewidths=2, zorder=8)
+                # build the stem segments (baseline to datapoint) in one vectorized stack
+                lines = np.stack([np.column_stack([x, np.zeros_like(y)]),
+                                  np.column_stack([x, y])], axis=1)
+                linecoll = matcoll.LineCollection(lines, colors=colors, linestyles=linestyles[colnum % len(linestyles)], linewidths=2, zorder=8, rasterized=True)
                 ax.add_collection(linecoll)
 
             ax.grid(True, axis='y') # turn the grid on for the y axis since the plot is wide
             ax.tick_params(axis='both', which='both', length=0) # disable all ticks since we have lines and a grid
 
-            maxcondnum = max(filter(None, condnums.flatten()))
+            maxcondnum = np.nanmax(condnums)
             stable_span = ax.axhspan(0, 7., facecolor='limegreen', alpha=0.5, zorder=5)
             critical_span = ax.axhspan(7., 10., facecolor='yellow', alpha=0.5, zorder=5)
             unstable_span = ax.axhspan(10., max(12., maxcondnum*1.1), facecolor='red', alpha=0.5, zorder=5)
@@ -397,12 +432,11 @@ def deltatest_comparison(ctx, collections, analysis,
                                       json={'metric': "deltatest",
                                             'testresult_collections': collection_ids})
         req.raise_for_status()
-        cdata = req.json()
+        cdata = response_json(req)
 
         cid2cname = {c['id']: c['name'] for c in cdata['testresult_collections']}
 
-        for cid, label in labels:
-            cid2cname[str(cid)] = label
+        cid2cname.update({str(cid): label for cid, label in labels})
 
         ncollections = len(collections)
 
@@ -4,15 +4,12 @@ import json
 import os
 import cgi
 
-from io import BytesIO
 from uuid import UUID
-from collections import OrderedDict
 from os import path
 
 import click
-import requests
 
-from . import cli, json_pretty_dumps, get_table_instance
+from . import cli, json_pretty_dumps, get_table_instance, response_json
 from .. import xyz_parser_iterator
 
 
@@ -49,7 +46,10 @@ def struct(ctx):
 def struct_add(ctx, xyzfile, name, name_prefix, name_field, sets, pbc, cubic_cell, replace_existing, dump, edit):
     """Upload a structure (in XYZ format)"""
 
-    structures = OrderedDict()
+    import requests
+    from requests_toolbelt import MultipartEncoder
+
+    structures = {}
 
     complete_input = xyzfile.read()
 
@@ -67,8 +67,8 @@ def struct_add(ctx, xyzfile, name, name_prefix, name_field, sets, pbc, cubic_cel
         else:
             structure_name = name_prefix + comment.split(';')[name_field]
 
-        if name in structures.keys():
-            raise click.UsageError("duplicated name found for structure {}".format(name))
+        if structure_name in structures:
+            raise click.UsageError("duplicated name found for structure {}".format(structure_name))
 
         structures[structure_name] = match.span()
 
@@ -77,7 +77,7 @@ def struct_add(ctx, xyzfile, name, name_prefix, name_field, sets, pbc, cubic_cel
         if dump:
             click.echo(complete_input[match.span()[0]:match.span()[1]])
 
-    overrides = OrderedDict()
+    overrides = {}
 
     if edit:
         for name, (spos, epos) in structures.items():
@@ -111,6 +111,11 @@ def struct_add(ctx, xyzfile, name, name_prefix, name_field, sets, pbc, cubic_cel
 
     click.confirm("Do you want to upload the structures (total: {})?".format(len(structures)), abort=True)
 
+    # encode the input once up front; for pure-ASCII input (the usual case for
+    # XYZ files) the parser's string spans are valid offsets into the bytes too
+    complete_input_bytes = complete_input.encode('utf-8')
+    spans_are_byte_offsets = len(complete_input_bytes) == len(complete_input)
+
     for name, (spos, epos) in structures.items():
         click.echo("Uploading structure '{}'.. ".format(name), nl=False)
 
@@ -126,19 +131,29 @@ def struct_add(ctx, xyzfile, name, name_prefix, name_field, sets, pbc, cubic_cel
         if name in overrides:
             data.update(overrides[name])
 
-        structure_file = BytesIO(complete_input[spos:epos].encode('utf-8'))
+        if spans_are_byte_offsets:
+            structure_file = complete_input_bytes[spos:epos]
+        else:
+            structure_file = complete_input[spos:epos].encode('utf-8')
+
+        # build the field list manually since 'sets' can occur multiple times,
+        # then stream the multipart body instead of having requests buffer a full copy
+        fields = [(k, str(v)) for k, v in data.items() if k != 'sets']
+        fields += [('sets', s) for s in data['sets']]
+        fields += [('geometry', ('geometry', structure_file, 'application/octet-stream'))]
+        enc = MultipartEncoder(fields=fields)
 
         try:
-            req = ctx.obj['session'].post(ctx.obj['struct_url'], data=data,
-                                          files={'geometry': structure_file})
+            req = ctx.obj['session'].post(ctx.obj['struct_url'], data=enc,
+                                          headers={'Content-Type': enc.content_type})
             req.raise_for_status()
         except requests.exceptions.HTTPError as exc:
             click.echo("failed")
             try:
-                msgs = exc.response.json()
+                msgs = response_json(exc.response)
 
                 # try to extract the error message
-                if isinstance(msgs, dict) and 'errors' in msgs.keys():
+                if isinstance(msgs, dict) and 'errors' in msgs:
                     ctx.fail(json_pretty_dumps(msgs['errors']))
 
                 ctx.fail(json_pretty_dumps(msgs))
@@ -148,7 +163,7 @@ def struct_add(ctx, xyzfile, name, name_prefix, name_field, sets, pbc, cubic_cel
             click.echo("failed")
             raise
 
-        click.echo("succeeded (id: {id})".format(**req.json()))
+        click.echo("succeeded (id: {id})".format(**response_json(req)))
 
 
 @struct.command('list')
@@ -164,7 +179,7 @@ def struct_list(ctx, **filters):
 
     req = ctx.obj['session'].get(ctx.obj['struct_url'], params=params)
     req.raise_for_status()
-    structs = req.json()
+    structs = response_json(req)
 
     table_header = ['id', 'name', 'sets']
 
@@ -198,9 +213,9 @@ def struct_show(ctx, structure_id):
 
     req = ctx.obj['session'].get(ctx.obj['struct_url'] + '/%s' % structure_id)
     req.raise_for_status()
-    struct = req.json()
+    struct = response_json(req)
 
-    data = OrderedDict()
+    data = {}
 
     data['Name'] = struct['name']
     data['Sets'] = ", ".join(struct['sets'])
@@ -239,10 +254,20 @@ def struct_show(ctx, structure_id):
 @click.pass_context
 def struct_rm(ctx, struct_ids):
     """Delete specified structures (if not referenced by any calculation)"""
-    for struct_id in struct_ids:
-        req = ctx.obj['session'].delete(ctx.obj['struct_url'] + '/{}'.format(struct_id))
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    base = ctx.obj['struct_url'] + '/'
+
+    def delete(struct_id):
+        req = ctx.obj['session'].delete(base + str(struct_id))
         req.raise_for_status()
 
+    # the deletions are independent round trips, run them concurrently
+    with ThreadPoolExecutor(max_workers=min(32, len(struct_ids))) as executor:
+        for future in as_completed([executor.submit(delete, sid) for sid in struct_ids]):
+            future.result()
+
 
 @cli.group()
 @click.pass_context
@@ -261,16 +286,18 @@ def structureset(ctx):
 def structureset_add(ctx, **data):
     """Create a new structure set"""
 
+    import requests
+
     try:
         req = ctx.obj['session'].post(ctx.obj['structureset_url'], data=data)
         req.raise_for_status()
     except requests.exceptions.HTTPError as exc:
         click.echo("failed")
         try:
-            msgs = exc.response.json()
+            msgs = response_json(exc.response)
 
             # try to extract the error message
-            if isinstance(msgs, dict) and 'errors' in msgs.keys():
+            if isinstance(msgs, dict) and 'errors' in msgs:
                 ctx.fail(json_pretty_dumps(msgs['errors']))
 
             ctx.fail(json_pretty_dumps(msgs))
@@ -288,7 +315,7 @@ def structureset_list(ctx):
 
     req = ctx.obj['session'].get(ctx.obj['structureset_url'])
     req.raise_for_status()
-    structuresets = req.json()
+    structuresets = response_json(req)
 
     table_data = [['name', 'description', 'superset']]
 
@@ -309,11 +336,11 @@ def structureset_download(ctx, structureset_name):
 
     req = ctx.obj['session'].get(ctx.obj['structureset_url'] + '/{}'.format(structureset_name))
     req.raise_for_status()
-    structuresets = req.json()
+    structuresets = response_json(req)
 
     req = ctx.obj['session'].get(structuresets['_links']['structures'])
     req.raise_for_status()
-    structures = req.json()
+    structures = response_json(req)
 
     os.mkdir(target_dir)
 
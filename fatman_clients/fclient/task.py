@@ -1,12 +1,13 @@
 
 import os
+import shutil
 
 from os import path
 from uuid import UUID
 
 import click
 
-from . import cli
+from . import cli, response_json
 
 @cli.group()
 @click.pass_context
@@ -23,7 +24,7 @@ def task_list_files(ctx, task_id):
 
     req = ctx.obj['session'].get(ctx.obj['task_url'] + '/{}'.format(task_id))
     req.raise_for_status()
-    task_content = req.json()
+    task_content = response_json(req)
 
     for infile in task_content['infiles']:
         click.echo("-> {}".format(infile['name']))
@@ -41,29 +42,42 @@ def task_download_files(ctx, task_id):
     current working directory and downloads all files
     """
 
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
     target_dir = "task_{}".format(task_id)
 
     req = ctx.obj['session'].get(ctx.obj['task_url'] + '/{}'.format(task_id))
     req.raise_for_status()
-    task_content = req.json()
+    task_content = response_json(req)
 
     os.mkdir(target_dir)
     os.mkdir(path.join(target_dir, 'infiles'))
     os.mkdir(path.join(target_dir, 'outfiles'))
 
-    for direction in ['infiles', 'outfiles']:
-        for artifact in task_content[direction]:
-            target_fn = path.join(target_dir, direction, artifact['name'])
-            click.echo("downloading {} to {}..".format(artifact['name'], target_fn), nl=False)
+    def download(artifact, target_fn):
+        req = ctx.obj['session'].get(artifact['_links']['download'], stream=True)
+        req.raise_for_status()
 
-            req = ctx.obj['session'].get(artifact['_links']['download'], stream=True)
-            req.raise_for_status()
+        # copy straight from the raw socket in large blocks,
+        # letting urllib3 handle the content decoding
+        req.raw.decode_content = True
 
-            with open(target_fn, 'wb') as fhandle:
-                for chunk in req.iter_content(1024):
-                    fhandle.write(chunk)
+        with open(target_fn, 'wb') as fhandle:
+            shutil.copyfileobj(req.raw, fhandle, length=262144)
 
-            click.echo(" done")
+    downloads = [(artifact, path.join(target_dir, direction, artifact['name']))
+                 for direction in ['infiles', 'outfiles']
+                 for artifact in task_content[direction]]
+
+    # the transfers are network-bound, fetch them concurrently
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = {executor.submit(download, artifact, target_fn): (artifact, target_fn)
+                   for artifact, target_fn in downloads}
+
+        for future in as_completed(futures):
+            artifact, target_fn = futures[future]
+            future.result()
+            click.echo("downloaded {} to {}".format(artifact['name'], target_fn))
 
 
 @task.command('upload-artifact')
@@ -74,12 +88,24 @@ def task_download_files(ctx, task_id):
 def task_upload_artifact(ctx, task_id, filename, name):
     """Upload artifacts for given task using the specified name"""
 
-    req = ctx.obj['session'].get(ctx.obj['task_url'] + '/{}'.format(task_id))
-    req.raise_for_status()
-    task_content = req.json()
+    # read the payload once so the fallback can replay it even when the
+    # argument is a non-seekable stream (e.g. '-' for stdin)
+    payload = filename.read()
+
+    # the uploads link follows the API's URL convention, so post there
+    # directly instead of fetching the task first just for its links
+    req = ctx.obj['session'].post(ctx.obj['task_url'] + '/{}/uploads'.format(task_id),
+                                  data={'name': name}, files={'data': payload})
+
+    if req.status_code in (404, 405):
+        # in case the server routes it differently, discover the link after all
+        req = ctx.obj['session'].get(ctx.obj['task_url'] + '/{}'.format(task_id))
+        req.raise_for_status()
+        task_content = response_json(req)
+
+        req = ctx.obj['session'].post(task_content['_links']['uploads'],
+                                      data={'name': name}, files={'data': payload})
 
-    req = ctx.obj['session'].post(task_content['_links']['uploads'],
-                                  data={'name': name}, files={'data': filename})
     req.raise_for_status()
 
 
@@ -94,7 +120,7 @@ def task_set_status(ctx, task_id, status):
         req = ctx.obj['session'].get(ctx.obj['task_url'] + '/{}'.format(tid))
         req.raise_for_status()
 
-        task = req.json()
+        task = response_json(req)
         req = ctx.obj['session'].patch(task['_links']['self'], json={'status': status})
         req.raise_for_status()
 
@@ -108,7 +134,7 @@ def task_read_artifact(ctx, task_id, artifact_name):
 
     req = ctx.obj['session'].get(ctx.obj['task_url'] + '/{}'.format(task_id))
     req.raise_for_status()
-    task_content = req.json()
+    task_content = response_json(req)
 
     for artifact in task_content['infiles'] + task_content['outfiles']:
         if artifact['name'] == artifact_name:
@@ -4,11 +4,10 @@ import csv
 import sys
 
 from uuid import UUID
-from collections import OrderedDict
 
 import click
 
-from . import cli, get_table_instance, bool2str
+from . import cli, get_table_instance, bool2str, json_bytes, JSON_BODY_HEADERS, response_json
 
 @cli.group()
 @click.pass_context
@@ -50,7 +49,7 @@ def testresult_list(ctx, csv_output, header, **filters):
 
     req = ctx.obj['session'].get(ctx.obj['testresult_url'], params=params)
     req.raise_for_status()
-    testresults = req.json()
+    testresults = response_json(req)
 
     header_data = [['id', 'collections', 'test', 'calc ID: structure, code']]
     if not header:
@@ -96,7 +95,7 @@ def testresult_tag(ctx, tag, ids, reset_tags):
         click.echo("Setting tag '{}' for test result {}".format(tag, trid), err=True)
         req = ctx.obj['session'].get(ctx.obj['testresult_url'] + '/{}'.format(trid))
         req.raise_for_status()
-        tresult = req.json()
+        tresult = response_json(req)
 
         metadata = tresult['metadata']
 
@@ -118,16 +117,21 @@ def testresult_tag(ctx, tag, ids, reset_tags):
 def testresult_generate_results(ctx, update, ids):
     """Read results from calculations and generate respective test results"""
 
+    # the body is the same for every request, serialize it once
+    body = json_bytes({'generate': {'update': update}})
+
     if ids:
+        base = ctx.obj['testresult_url'] + '/'
+
         for tid in ids:
             click.echo("Trigger test result (re-)generation for test result {}".format(tid))
-            req = ctx.obj['session'].post(ctx.obj['testresult_url'] + '/{}/action'.format(tid),
-                                          json={'generate': {'update': update}})
+            req = ctx.obj['session'].post(base + str(tid) + '/action',
+                                          data=body, headers=JSON_BODY_HEADERS)
             req.raise_for_status()
     else:
         click.echo("Trigger test result (re-)generation for all calculations, resp. test results")
         req = ctx.obj['session'].post(ctx.obj['testresult_url'] + '/action',
-                                      json={'generate': {'update': update}})
+                                      data=body, headers=JSON_BODY_HEADERS)
         req.raise_for_status()
 
     # TODO: implement result parsing and waiting for finish
@@ -149,7 +153,7 @@ def trcollections_list(ctx):
 
     req = ctx.obj['session'].get(ctx.obj['trcollections_url'])
     req.raise_for_status()
-    trcolls = req.json()
+    trcolls = response_json(req)
 
     table_data = [
         ['id', 'name', 'number of results', 'description'],
@@ -179,7 +183,7 @@ def trcollections_show(ctx, extended_info, id):
 
     req = ctx.obj['session'].get(ctx.obj['trcollections_url'] + '/%s' % id)
     req.raise_for_status()
-    trcoll = req.json()
+    trcoll = response_json(req)
 
     click.echo("Name: {name}".format(**trcoll))
     click.echo("Description:\n{desc}\n".format(**trcoll))
@@ -211,7 +215,7 @@ def trcollections_show(ctx, extended_info, id):
         if extended_info:
             req = ctx.obj['session'].get(tr['_links']['self'])
             req.raise_for_status()
-            fulltr = req.json()
+            fulltr = response_json(req)
 
             calcs = fulltr['calculations']
 
@@ -247,7 +251,7 @@ def trcollections_create(ctx, name, desc, copy_from, copy_from_exclude, include)
     if copy_from:
         req = ctx.obj['session'].get(ctx.obj['trcollections_url'] + '/%s' % copy_from)
         req.raise_for_status()
-        trcoll = req.json()
+        trcoll = response_json(req)
 
         excludes = [str(i) for i in copy_from_exclude] if copy_from_exclude else []
         results += [tr['id'] for tr in trcoll['testresults'] if tr['id'] not in excludes]
@@ -260,7 +264,7 @@ def trcollections_create(ctx, name, desc, copy_from, copy_from_exclude, include)
 
     req = ctx.obj['session'].post(ctx.obj['trcollections_url'], json=payload)
     req.raise_for_status()
-    trcoll = req.json()
+    trcoll = response_json(req)
 
     click.echo("done, the assigned ID for the new collection: {id}".format(**trcoll))
 
@@ -12,9 +12,8 @@ from glob import glob
 import click
 import click_log
 import requests
-from requests.packages import urllib3
 
-from . import try_verify_by_system_ca_bundle
+from . import get_session
 from .runners import ClientError, DirectRunner, SlurmRunner, MPIRunner
 
 TASKS_URL = '{}/api/v2/tasks'
@@ -101,13 +100,7 @@ def main(url, hostname, nap_time, data_dir,
 
     os.chdir(data_dir)
 
-    sess = requests.Session()
-
-    if ssl_verify:
-        sess.verify = try_verify_by_system_ca_bundle()
-    else:
-        sess.verify = False
-        urllib3.disable_warnings()
+    sess = get_session(url, ssl_verify, timeouts=False)
 
     sess.headers.update({
         'x-fatman-worker-hostname': hostname,
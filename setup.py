@@ -8,12 +8,15 @@ setup(
     packages=find_packages(),
     license='GPL3',
     install_requires=[
-        'click>=6.6',
+        'click>=8.0',
         'click-log>=0.1.4',
         'six>=1.10.0',
-        'requests>=2.9.1',
+        'requests>=2.26.0',
+        'urllib3>=1.26.0',
+        'requests-toolbelt>=0.7.0',
         'terminaltables>=3.1.0',
         'dpath>=1.4.0',
+        'numpy>=1.17.0',
         'periodictable>=1.5.0',
         ],
     entry_points='''